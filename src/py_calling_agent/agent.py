@@ -1,60 +1,123 @@
-from .prompts import DEFAULT_SYSTEM_PROMPT, EXECUTION_OUTPUT_PROMPT, DEFAULT_INSTRUCTIONS, DEFAULT_AGENT_IDENTITY, DEFAULT_ADDITIONAL_CONTEXT, EXECUTION_OUTPUT_EXCEEDED_PROMPT, SECURITY_ERROR_PROMPT
-from .python_runtime import PythonRuntime, SecurityError
-from typing import List, Dict, Any, AsyncGenerator
+from .prompts import DEFAULT_SYSTEM_PROMPT, EXECUTION_OUTPUT_PROMPT, DEFAULT_INSTRUCTIONS, DEFAULT_AGENT_IDENTITY, DEFAULT_ADDITIONAL_CONTEXT, EXECUTION_OUTPUT_EXCEEDED_PROMPT, SECURITY_ERROR_PROMPT, PARTIAL_EXECUTION_PROMPT
+from .python_runtime import PythonRuntime, SecurityError, ExecutionResult
+from typing import List, Dict, Any, AsyncGenerator, Tuple, Optional, Deque, Final, Callable
 from .models import Model
 from rich.console import Console
 from rich.text import Text
 from rich.style import Style
-from .utils import extract_python_code
+from .utils import extract_python_code, iter_python_code_blocks, PromptTemplate
 from .streaming_text_parser import SegmentType, StreamingTextParser
 from enum import Enum, IntEnum
 from datetime import datetime
 from .constant import DEFAULT_PYTHON_BLOCK_IDENTIFIER
+from collections import deque
+from operator import attrgetter
+from functools import lru_cache
+from contextlib import aclosing
+import asyncio
+import copy
+import io
+import sys
 import traceback
-class MessageRole(str, Enum):
-    SYSTEM = "system"
-    USER = "user"
-    ASSISTANT = "assistant"
-    CODE_EXECUTION = "code_execution"
-    EXECUTION_RESULT = "execution_result"
 
+# Execution feedback prompts have a single placeholder, so they are split once
+# and filled by concatenation instead of str.format on every step.
+_EXECUTION_OUTPUT_PREFIX, _, _EXECUTION_OUTPUT_SUFFIX = EXECUTION_OUTPUT_PROMPT.partition("{execution_output}")
+_SECURITY_ERROR_PREFIX, _, _SECURITY_ERROR_SUFFIX = SECURITY_ERROR_PROMPT.partition("{error}")
+_CURRENT_TIME_PLACEHOLDER = "\x00current_time\x00"
+# Fetches each message's cached API payload inside map(), without a Python-level loop
+_get_payload = attrgetter("_dict")
 
-role_conversions = {
+def _system_prompt_field(name: str) -> property:
+    """Agent attribute that is bound into the system prompt template, rebinding it when assigned."""
+    attribute = "_" + name
+
+    def get_field(agent: "PyCallingAgent") -> str:
+        return getattr(agent, attribute)
+
+    def set_field(agent: "PyCallingAgent", value: str):
+        setattr(agent, attribute, value)
+        agent._bind_system_prompt()
+
+    return property(get_field, set_field)
+
+@lru_cache(maxsize=None)
+def _compile_full_history_preparer(length: int) -> Callable[["SystemMessage", Deque["Message"]], List[Dict[str, str]]]:
+    """Generate a loop-free `_prepare_messages` for a history holding exactly `length` messages.
+
+    Once a conversation fills its bounded history, every step prepares a list of the
+    same shape, so unpacking into locals and building the list literally avoids the
+    per-message iteration.
+    """
+    names = [f"m{i}" for i in range(length)]
+    source = (
+        "def prepare(system_message, history):\n"
+        f"    {', '.join(names)}, = history\n"
+        f"    return [system_message._dict, {', '.join(name + '._dict' for name in names)}]\n"
+    )
+    namespace = {}
+    exec(compile(source, f"<full history preparer: {length}>", "exec"), namespace)
+    return namespace["prepare"]
+
+class MessageRole:
+    """Message roles, as plain strings so no Enum lookup is needed per message."""
+    SYSTEM: Final = "system"
+    USER: Final = "user"
+    ASSISTANT: Final = "assistant"
+    CODE_EXECUTION: Final = "code_execution"
+    EXECUTION_RESULT: Final = "execution_result"
+
+
+role_conversions: Dict[str, str] = {
     MessageRole.CODE_EXECUTION: MessageRole.ASSISTANT,
     MessageRole.EXECUTION_RESULT: MessageRole.USER,
 }
 
 class Message():
     """Base class for all message types in the agent conversation."""
-    def __init__(self, content: str, role: MessageRole):
+    __slots__ = ("content", "role", "_dict")
+
+    def __init__(self, content: str, role: str):
         self.content = content
         self.role = role
+        # Messages are immutable once created, so the LLM API payload is built once
+        self._dict = {"role": role_conversions.get(role, role), "content": content}
         
     def to_dict(self) -> Dict[str, str]:
         return {"role": self.role, "content": self.content}
     
 class SystemMessage(Message):
     """System message that provides instructions to the LLM."""
+    __slots__ = ()
+
     def __init__(self, content: str):
         super().__init__(content, MessageRole.SYSTEM)
 
 class UserMessage(Message):
     """Message from the user to the agent."""
+    __slots__ = ()
+
     def __init__(self, content: str):
         super().__init__(content, MessageRole.USER)
 class AssistantMessage(Message):
 
     """Message from the assistant (LLM) to the user."""
+    __slots__ = ()
+
     def __init__(self, content: str):
         super().__init__(content, MessageRole.ASSISTANT)
 
 class CodeExecutionMessage(Message):
     """Message representing code to be executed by the agent."""
+    __slots__ = ()
+
     def __init__(self, content: str):
         super().__init__(content, MessageRole.CODE_EXECUTION)
 
 class ExecutionResultMessage(Message):
     """Message representing the result from code execution."""
+    __slots__ = ()
+
     def __init__(self, content: str):
         super().__init__(content, MessageRole.EXECUTION_RESULT)
 
@@ -74,12 +137,17 @@ class EventType(Enum):
     MAX_STEPS_REACHED = "max_steps_reached"
     SECURITY_ERROR = "security_error"
 
+# One console for all loggers; messages are built as Text, so markup and
+# highlighting would only add parsing work.
+_console = Console(markup=False, highlight=False)
+
 class Logger:
     """
     A structured logger for Agent that provides leveled logging with rich formatting.
     
     Handles different types of log messages (debug, info, error) with customizable 
-    styling and visibility levels. Uses rich library for enhanced console output.
+    styling and visibility levels. Uses rich library for enhanced console output
+    at DEBUG level; at INFO and ERROR, messages are written to stderr as plain text.
 
     Log Levels:
     - ERROR (0): Only critical errors
@@ -89,7 +157,7 @@ class Logger:
 
     def __init__(self, level: LogLevel = LogLevel.INFO):
         """Initialize logger with specified verbosity level."""
-        self.console = Console()
+        self.console = _console
         self.level = level
         self.level_styles = {
             LogLevel.DEBUG: Style(color="yellow", bold=False),
@@ -102,30 +170,39 @@ class Logger:
             LogLevel.INFO: "INFO",
             LogLevel.ERROR: "ERROR"
         }
+        self._parsed_styles: Dict[str, Style] = {}
     
     def __log(self, title: str, content: Any, style: str, level: LogLevel = LogLevel.INFO):
-        if level <= self.level:
-            # Create composite log message with improved formatting
-            message = Text()
+        if self.level < LogLevel.DEBUG:
+            print(f"[{self.level_prefix[level]}] {title}: \n{content}", file=sys.stderr)
+            return
 
-            # Add log level indicator
-            message.append(f"[{self.level_prefix[level]}] ", self.level_styles[level])
-            
-            style = Style.parse(style)
-            message.append(f"{title}: \n", style)
-            
-            message.append(content, style)
+        # Create composite log message with improved formatting
+        message = Text()
+
+        # Add log level indicator
+        message.append(f"[{self.level_prefix[level]}] ", self.level_styles[level])
+        
+        parsed_style = self._parsed_styles.get(style)
+        if parsed_style is None:
+            parsed_style = self._parsed_styles[style] = Style.parse(style)
+        message.append(f"{title}: \n", parsed_style)
+        
+        message.append(content, parsed_style)
 
-            self.console.print(message)
+        self.console.print(message)
 
     def debug(self, title: str, content: Any, style: str = "yellow"):
-        self.__log(title, content, style, LogLevel.DEBUG)
+        if LogLevel.DEBUG <= self.level:
+            self.__log(title, content, style, LogLevel.DEBUG)
 
     def info(self, title: str, content: Any, style: str = "blue"):
-        self.__log(title, content, style, LogLevel.INFO)
+        if LogLevel.INFO <= self.level:
+            self.__log(title, content, style, LogLevel.INFO)
 
     def error(self, title: str, content: Any, style: str = "red"):
-        self.__log(title, content, style, LogLevel.ERROR)
+        if LogLevel.ERROR <= self.level:
+            self.__log(title, content, style, LogLevel.ERROR)
 
 class ContextState(IntEnum):
     """Execution context state enumeration."""
@@ -136,34 +213,36 @@ class ContextState(IntEnum):
 
 class ExecutionContext:
     """Manages execution state with max steps limit."""
+    __slots__ = ("max_steps", "code_snippets", "total_steps", "state", "is_running")
     
     def __init__(self, max_steps: int = 10):
         self.max_steps = max_steps
         self.code_snippets = []
         self.total_steps = 0
         self.state = ContextState.INITIALIZED
+        # Kept in sync with state so the step loop reads a plain attribute
+        self.is_running = False
     
     def start(self) -> None:
         """Initialize execution context."""
         self.total_steps = 0
         self.state = ContextState.RUNNING
+        self.is_running = True
     
     def next_step(self) -> bool:
         """Record a step execution. Returns False if max steps reached."""
-        if self.total_steps >= self.max_steps:
+        step = self.total_steps + 1
+        if step > self.max_steps:
             self.state = ContextState.MAX_STEPS_REACHED
+            self.is_running = False
             return False
-        
-        self.total_steps += 1
+        self.total_steps = step
         return True
     
     def complete(self) -> None:
         """Mark execution as completed successfully."""
         self.state = ContextState.COMPLETED
-    
-    @property
-    def is_running(self) -> bool:
-        return self.state == ContextState.RUNNING
+        self.is_running = False
     
 class ExecutionStatus(Enum):
     """Status of agent execution."""
@@ -171,12 +250,15 @@ class ExecutionStatus(Enum):
     MAX_STEPS_REACHED = "max_steps_reached"
 
 class Event:
+    __slots__ = ("type", "content")
+
     def __init__(self, type: EventType, content: str):
         self.type = type
         self.content = content
 
 class AgentResponse:
     """Response from the agent."""
+    __slots__ = ("content", "status", "steps_taken", "max_steps", "code_snippets")
     
     def __init__(
         self,
@@ -184,13 +266,13 @@ class AgentResponse:
         status: ExecutionStatus,
         steps_taken: int = 0,
         max_steps: int = 0,
-        code_snippets: List[str] = [],
+        code_snippets: Optional[List[str]] = None,
     ):
         self.content = content
         self.status = status
         self.steps_taken = steps_taken
         self.max_steps = max_steps
-        self.code_snippets = code_snippets
+        self.code_snippets = code_snippets if code_snippets is not None else []
 
     def __str__(self) -> str:
         """String representation of the response."""
@@ -222,9 +304,12 @@ class PyCallingAgent:
         runtime (PythonRuntime, optional): Python runtime with functions and variables.
             If None, creates an empty runtime. Defaults to None.
         messages (List[Message], optional): Initial conversation history.
-            List of Message objects to start with. Defaults to empty list.
+            List of Message objects to start with. Defaults to None (empty history).
+            Only the most recent max_history messages are kept. `agent.messages` is
+            read-only afterwards; assign a new list to replace the history.
         max_history (int, optional): Maximum message history to retain.
-            Prevents memory bloat in long conversations. Defaults to 10.
+            Prevents memory bloat in long conversations. The system message and the
+            latest message are always kept. Defaults to 10.
         max_execution_result_length (int, optional): Maximum length of execution result to be fed back to the LLM.
             Prevents the agent from generating too long execution results. Defaults to 3000.
 
@@ -241,6 +326,11 @@ class PyCallingAgent:
         >>> print(result)  # "The sum is: 8"
     """
 
+    system_prompt_template = _system_prompt_field("system_prompt_template")
+    agent_identity = _system_prompt_field("agent_identity")
+    instructions = _system_prompt_field("instructions")
+    additional_context = _system_prompt_field("additional_context")
+
     def __init__(
         self,
         model: Model,
@@ -252,34 +342,52 @@ class PyCallingAgent:
         additional_context: str = DEFAULT_ADDITIONAL_CONTEXT,
         runtime: PythonRuntime = None,
         python_block_identifier: str = DEFAULT_PYTHON_BLOCK_IDENTIFIER,
-        messages: List[Message] = [],
+        messages: Optional[List[Message]] = None,
         max_history: int = 10,
         max_execution_result_length: int = 3000,
         
     ):
         """Initialize PyCallingAgent with improved parameter handling."""
         self.model = model
-        self.system_prompt_template = system_prompt_template
+        self._system_prompt_template = system_prompt_template
         self.max_steps = max_steps
         self.runtime = runtime if runtime else PythonRuntime()
-        self.agent_identity = agent_identity
-        self.instructions = instructions.format(python_block_identifier=python_block_identifier)
-        self.additional_context = additional_context.format(python_block_identifier=python_block_identifier)
+        self._agent_identity = agent_identity
+        self._instructions = instructions.format(python_block_identifier=python_block_identifier)
+        self._additional_context = additional_context.format(python_block_identifier=python_block_identifier)
         self.python_block_identifier = python_block_identifier
-        self.messages = messages.copy()
-        self.max_history = max_history
+        self._max_history = max_history
+        self.messages = messages or []
         self.max_execution_result_length = max_execution_result_length
         self.logger = Logger(log_level)
+        self._bind_system_prompt()
+
+    def _bind_system_prompt(self):
+        """Bind identity, instructions and additional context into the system prompt template."""
+        # These only change when assigned, so bind them once and only render the
+        # runtime-dependent fields per step.
+        self._system_prompt = PromptTemplate(
+            self._system_prompt_template,
+            agent_identity=self._agent_identity,
+            instructions=self._instructions,
+            additional_context=self._additional_context,
+        )
+        # (runtime version, system prompt with a placeholder for the current time)
+        self._system_prompt_cache = (-1, None)
 
     def build_system_prompt(self) -> str:
         """Build and format the system prompt with current runtime state."""
-        return self.system_prompt_template.format(
-            functions=self.runtime.describe_functions(), 
-            variables=self.runtime.describe_variables(), 
-            agent_identity=self.agent_identity,
-            instructions=self.instructions,
-            current_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            additional_context=self.additional_context,
+        version = self.runtime._runtime_version
+        if version != self._system_prompt_cache[0]:
+            # Runtime descriptions only change with the runtime, the time on every call
+            prompt = self._system_prompt.format(
+                functions=self.runtime.describe_functions(), 
+                variables=self.runtime.describe_variables(), 
+                current_time=_CURRENT_TIME_PLACEHOLDER,
+            )
+            self._system_prompt_cache = (version, prompt)
+        return self._system_prompt_cache[1].replace(
+            _CURRENT_TIME_PLACEHOLDER, datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         )
 
     async def run(self, query: str) -> AgentResponse:
@@ -312,8 +420,52 @@ class PyCallingAgent:
                     max_steps=self.max_steps
                 )
 
+    async def run_many(self, queries: List[str], independent: bool = True) -> List[AgentResponse]:
+        """Execute several user queries, concurrently when they are independent.
+
+        Independent queries each run on a fork of the runtime with a copy of the
+        current conversation, so the LLM calls of all queries overlap. Afterwards,
+        managed variables changed by a fork are written back to this runtime (for
+        the same variable, the later query wins) and the conversation history is
+        left unchanged. Variable values are shared by reference between forks, so
+        queries that mutate the same object in place are not independent.
+
+        Dependent queries run one after another through `run`.
+
+        Returns:
+            List of AgentResponse, in the same order as the queries.
+        """
+        if not independent:
+            return [await self.run(query) for query in queries]
+
+        snapshot = {name: self.runtime.get_variable_value(name) for name in self.runtime._variables}
+        agents = [self._spawn(self.runtime.fork()) for _ in queries]
+        responses = await asyncio.gather(*(agent.run(query) for agent, query in zip(agents, queries)))
+
+        for agent in agents:
+            for name, value in snapshot.items():
+                forked_value = agent.runtime.get_variable_value(name)
+                if forked_value is not value:
+                    self.runtime.set_variable_value(name, forked_value)
+        return list(responses)
+
+    def _spawn(self, runtime: PythonRuntime) -> "PyCallingAgent":
+        """Create an agent sharing this agent's model and configuration on another runtime."""
+        agent = copy.copy(self)
+        agent.runtime = runtime
+        agent.messages = self.messages
+        return agent
+
     async def stream_events(self, query: str) -> AsyncGenerator[Event, None]:
-        """Stream events during agent execution."""
+        """Stream events during agent execution.
+
+        The first code block of a response starts executing while the rest of the
+        response streams in. If the consumer stops iterating after that, the block
+        still runs to completion before the generator closes, but its output is not
+        recorded in the conversation history. If further blocks follow and the code
+        as a whole fails the security check or does not compile, only the first block
+        has run, and the execution output tells the model so.
+        """
         context = ExecutionContext(self.max_steps)
         context.start()
         self._initialize_conversation(query)
@@ -326,11 +478,13 @@ class PyCallingAgent:
                 yield Event(EventType.MAX_STEPS_REACHED, "Max steps reached")
                 return
             
-            async for event in self._stream_step_execution(context):
-                yield event
-                
-                if not context.is_running:
-                    return
+            # Closed explicitly so an early exit still settles the step's execution
+            async with aclosing(self._stream_step_execution(context)) as step_events:
+                async for event in step_events:
+                    yield event
+                    
+                    if not context.is_running:
+                        return
 
     async def _execute_step(self, context: ExecutionContext) -> str:
         """Execute a single step and return result."""
@@ -347,31 +501,74 @@ class PyCallingAgent:
         self._log_step(context)
         
         # Stream LLM response and collect
-        chunks = []
+        response_buffer = io.StringIO()
         parser = StreamingTextParser(self.python_block_identifier)
+        # Bound once, called for every chunk
+        write_chunk = response_buffer.write
+        process_chunk = parser.process_chunk
+        # The first code block found by the parser, held until the response confirms
+        # it is a real block, and the task already executing it
+        pending_code = None
+        can_speculate = True
+        speculative = None
         
-        async for chunk in self.model.stream(self._prepare_messages()):
-            chunks.append(chunk)
+        try:
+            async for chunk in self.model.stream(self._prepare_messages()):
+                write_chunk(chunk)
+                
+                # Parse and yield streaming events
+                parsed_segments = process_chunk(chunk)
+                for segment in parsed_segments:
+                    if segment.type == SegmentType.TEXT:
+                        yield Event(EventType.TEXT, segment.content)
+                    elif segment.type == SegmentType.CODE:
+                        if segment.content and can_speculate:
+                            pending_code = segment.content
+                            can_speculate = False
+                        yield Event(EventType.CODE, segment.content)
+
+                if pending_code is not None and "\n" in chunk:
+                    speculative, pending_code = self._start_speculative_execution(response_buffer.getvalue(), pending_code)
             
-            # Parse and yield streaming events
-            parsed_segments = parser.process_chunk(chunk)
-            for segment in parsed_segments:
+            final_segments = parser.flush()
+            for segment in final_segments:
                 if segment.type == SegmentType.TEXT:
                     yield Event(EventType.TEXT, segment.content)
                 elif segment.type == SegmentType.CODE:
                     yield Event(EventType.CODE, segment.content)
-        
-        final_segments = parser.flush()
-        for segment in final_segments:
-            if segment.type == SegmentType.TEXT:
-                yield Event(EventType.TEXT, segment.content)
-            elif segment.type == SegmentType.CODE:
-                yield Event(EventType.CODE, segment.content)
-
-        model_response = "".join(chunks)
-        # Process complete response
-        async for event in self._process_model_response_streaming(model_response, context):
-            yield event
+
+            model_response = response_buffer.getvalue()
+            # Process complete response
+            async for event in self._process_model_response_streaming(model_response, context, speculative):
+                yield event
+        finally:
+            if speculative is not None:
+                # Cancelling would not stop a cell that is already running, so let it
+                # finish before the runtime can be used again
+                await asyncio.gather(speculative[1], return_exceptions=True)
+
+    def _start_speculative_execution(self, partial_response: str, parsed_code: str) -> Tuple[Optional[Tuple[str, asyncio.Task]], Optional[str]]:
+        """Start executing the first code block while the rest of the response streams in.
+
+        The streaming parser also reacts to fences inside strings or inline text, so
+        its block only serves as a hint: execution starts once `extract_python_code`
+        over the complete lines received so far yields the same first block, which
+        later text can no longer change.
+
+        Returns:
+            The speculated code and its task (or None), and the code still waiting
+            for confirmation (or None once decided).
+        """
+        complete_lines = partial_response[:partial_response.rfind("\n") + 1]
+        blocks = list(iter_python_code_blocks(complete_lines, self.python_block_identifier))
+        if blocks and not blocks[-1][1]:
+            # A block is still open and may yet absorb the parsed code
+            return None, parsed_code
+
+        first_block = next((code for code, _ in blocks if code), None)
+        if first_block is None or first_block.strip() != parsed_code.strip():
+            return None, None
+        return (first_block, asyncio.create_task(self.runtime.execute(first_block))), None
 
     async def _process_model_response(self, model_response: str, context: ExecutionContext) -> str:
         """Process model response and execute code if needed."""
@@ -393,14 +590,14 @@ class PyCallingAgent:
         if not execution_result.success and isinstance(execution_result.error, SecurityError):
             execution_error = execution_result.error.message
             self.logger.debug("Security error", execution_error, "red")
-            next_prompt = SECURITY_ERROR_PROMPT.format(error=execution_error)
+            next_prompt = _SECURITY_ERROR_PREFIX + execution_error + _SECURITY_ERROR_SUFFIX
         else:
             stdout_length = len(execution_result.stdout)
             if stdout_length > self.max_execution_result_length:
                 self.logger.debug("Execution output too long", f"Output length: {stdout_length} characters (max: {self.max_execution_result_length})", "yellow")
                 next_prompt = EXECUTION_OUTPUT_EXCEEDED_PROMPT.format(output_length=stdout_length, max_length=self.max_execution_result_length)
             else:
-                next_prompt = EXECUTION_OUTPUT_PROMPT.format(execution_output=execution_result.stdout)
+                next_prompt = _EXECUTION_OUTPUT_PREFIX + execution_result.stdout + _EXECUTION_OUTPUT_SUFFIX
                 if execution_result.success:
                     self.logger.debug("Execution output", execution_result.stdout, "cyan")
                 else:
@@ -410,7 +607,8 @@ class PyCallingAgent:
         return model_response
 
     async def _process_model_response_streaming(self, model_response: str, 
-                                            context: ExecutionContext) -> AsyncGenerator[Event, None]:
+                                            context: ExecutionContext,
+                                            speculative: Optional[Tuple[str, asyncio.Task]] = None) -> AsyncGenerator[Event, None]:
         """Process model response with streaming events."""
         code_snippet = extract_python_code(model_response, self.python_block_identifier)
         if not code_snippet:
@@ -423,13 +621,13 @@ class PyCallingAgent:
         
         self.add_message(CodeExecutionMessage(model_response))
 
+        execution_result = await self._execute_code_snippet(code_snippet, speculative)
         self.logger.debug("Code snippet", code_snippet, "green")
-        execution_result = await self.runtime.execute(code_snippet)
     
         if not execution_result.success and isinstance(execution_result.error, SecurityError):
             execution_error = execution_result.error.message
             self.logger.debug("Security error", execution_error, "red")
-            next_prompt = SECURITY_ERROR_PROMPT.format(error=execution_error)
+            next_prompt = _SECURITY_ERROR_PREFIX + execution_error + _SECURITY_ERROR_SUFFIX
             self.add_message(ExecutionResultMessage(next_prompt))
             yield Event(EventType.SECURITY_ERROR, execution_error)
         else:
@@ -441,7 +639,7 @@ class PyCallingAgent:
                 self.add_message(ExecutionResultMessage(next_prompt))
                 yield Event(EventType.EXECUTION_OUTPUT_EXCEEDED, execution_result.stdout)
             else:
-                next_prompt = EXECUTION_OUTPUT_PROMPT.format(execution_output=execution_result.stdout)
+                next_prompt = _EXECUTION_OUTPUT_PREFIX + execution_result.stdout + _EXECUTION_OUTPUT_SUFFIX
                 self.add_message(ExecutionResultMessage(next_prompt))
                 if execution_result.success:
                     self.logger.debug("Execution output", execution_result.stdout, "cyan")
@@ -450,8 +648,48 @@ class PyCallingAgent:
                     self.logger.debug("Execution output with error", execution_result.stdout, "red")
                     yield Event(EventType.EXECUTION_ERROR, execution_result.stdout)
                 
+    async def _execute_code_snippet(self, code_snippet: str,
+                                    speculative: Optional[Tuple[str, asyncio.Task]] = None) -> ExecutionResult:
+        """Execute the code snippet, reusing a speculative execution started during streaming."""
+        if speculative is None:
+            return await self.runtime.execute(code_snippet)
+
+        speculated_code, task = speculative
+        if code_snippet == speculated_code:
+            return await task
+
+        # extract_python_code joins blocks with a blank line, so further blocks follow this separator
+        separator = speculated_code + "\n\n"
+        if not code_snippet.startswith(separator):
+            self.logger.debug("Speculative execution discarded", speculated_code, "yellow")
+            await asyncio.gather(task, return_exceptions=True)
+            return await self.runtime.execute(code_snippet)
+
+        first_result = await task
+        # The first block already ran as a cell of its own, but the rest may only run
+        # if the snippet as a whole passes the checks it would have had as one cell
+        rejection = self.runtime.check(code_snippet)
+        if rejection is not None:
+            reason = rejection.message if isinstance(rejection, SecurityError) else "".join(traceback.format_exception_only(rejection))
+            self.logger.debug("Remaining code blocks rejected", reason, "red")
+            note = PARTIAL_EXECUTION_PROMPT.format(error=reason.rstrip())
+            error = RuntimeError(note.strip())
+            error.__cause__ = rejection
+            return ExecutionResult(error=error, stdout=(first_result.stdout or "") + note)
+        if not first_result.success:
+            return first_result
+
+        # Further code blocks followed the speculated one; run them after it as if in one cell
+        rest_result = await self.runtime.execute(code_snippet[len(separator):])
+        return ExecutionResult(
+            error=rest_result.error,
+            stdout=(first_result.stdout or "") + (rest_result.stdout or "")
+        )
+
     def _log_step(self, context: ExecutionContext):
         """Log step execution info."""
+        if self.logger.level < LogLevel.DEBUG:
+            return
         self.logger.debug(
             f"Step {context.total_steps}/{context.max_steps}", 
             f"Processing...", 
@@ -465,51 +703,65 @@ class PyCallingAgent:
         self.add_message(UserMessage(user_query))
 
 
+    @property
+    def max_history(self) -> int:
+        """Maximum number of messages kept, including the system message."""
+        return self._max_history
+
+    @max_history.setter
+    def max_history(self, max_history: int):
+        self._max_history = max_history
+        # Rebuild the bounded history for the new limit, dropping the oldest messages if needed
+        self.messages = self.messages
+
+    @property
+    def messages(self) -> Tuple[Message, ...]:
+        """Conversation history, with the system message (if any) first.
+
+        This is a read-only snapshot; assign a new list to replace the history,
+        e.g. `agent.messages = []` to reset the conversation.
+        """
+        if self._system_message:
+            return (self._system_message, *self._history)
+        return tuple(self._history)
+
+    @messages.setter
+    def messages(self, messages: List[Message]):
+        # The system message is held apart so the bounded deque only ever
+        # evicts the oldest non-system messages.
+        self._system_message: Optional[SystemMessage] = None
+        # At least the latest message is kept, so a new query is never evicted on arrival
+        self._history: Deque[Message] = deque(maxlen=max(self._max_history - 1, 1))
+        # Built for the deque's length, which only changes here
+        self._prepare_full_history = _compile_full_history_preparer(self._history.maxlen)
+        if messages and isinstance(messages[0], SystemMessage):
+            self._system_message = messages[0]
+            messages = messages[1:]
+        self._history.extend(messages)
+
     def _update_system_message(self):
         """Update or insert system message."""
 
         system_prompt = self.build_system_prompt()
         self.logger.debug("System prompt loaded", system_prompt, "blue")
-
-        if self.messages and isinstance(self.messages[0], SystemMessage):
-            self.messages[0] = SystemMessage(system_prompt)
-        else:
-            self.messages.insert(0, SystemMessage(system_prompt))
+        self._system_message = SystemMessage(system_prompt)
 
     def _prepare_messages(self) -> List[Dict[str, str]]:
         """Convert internal message objects to dict format for LLM API."""
-        return [
-            {
-                "role": role_conversions.get(message.role, message.role).value,
-                "content": message.content
-            }
-            for message in self.messages
-        ]
+        if self._system_message and len(self._history) == self._history.maxlen:
+            return self._prepare_full_history(self._system_message, self._history)
+        prepared = [self._system_message._dict] if self._system_message else []
+        prepared.extend(map(_get_payload, self._history))
+        return prepared
     
     def add_message(self, message: Message):
         """Add message with automatic history management."""
-        self.messages.append(message)
-        self.logger.debug("History length", f"Current history length: {len(self.messages)}/{self.max_history}", "yellow")
-        self._trim_history()
-    
-    def _trim_history(self):
-        """Trim message history if needed."""
-        if len(self.messages) > self.max_history:
-            # Always keep system message at index 0
-            system_msg = self.messages[0]
-            
-            # Get all non-system messages
-            non_system_messages = self.messages[1:]
-            
-            # Keep only the most recent (max_history - 1) non-system messages
-            max_non_system_messages = self.max_history - 1
-            
-            if len(non_system_messages) > max_non_system_messages:
-                recent_msgs = non_system_messages[-max_non_system_messages:]
-            else:
-                recent_msgs = non_system_messages
-                
-            # Reconstruct the message list
-            self.messages = [system_msg] + recent_msgs
-            
-            self.logger.debug("History trimmed", f"Trimmed to {len(self.messages)}/{self.max_history} messages", "yellow")
\ No newline at end of file
+        trimmed = len(self._history) == self._history.maxlen
+        self._history.append(message)
+
+        # Skip building the log strings unless they will be shown
+        if self.logger.level >= LogLevel.DEBUG:
+            history_length = len(self._history) + (self._system_message is not None)
+            self.logger.debug("History length", f"Current history length: {history_length}/{self.max_history}", "yellow")
+            if trimmed:
+                self.logger.debug("History trimmed", f"Dropped oldest message to keep {self.max_history} messages", "yellow")
@@ -1,10 +1,14 @@
 from abc import ABC, abstractmethod
 from typing import List, Dict, Optional, Any, AsyncIterator
+import hashlib
 
 class Model(ABC):
     """
     Abstract base class for language model engines.
     Defines interface for interacting with different LLM providers.
+
+    Message dicts passed to `call` and `stream` are reused across steps and
+    must not be modified in place.
     """
 
     @abstractmethod
@@ -17,6 +21,28 @@ class Model(ABC):
         """Stream response tokens from message history asynchronously."""
         pass
 
+class _SystemPromptHasher:
+    """
+    Computes a stable key for the system prompt of a message list.
+
+    The agent sends the same system message object on every step of a run,
+    so the hash is only recomputed when the system prompt changes.
+    """
+
+    def __init__(self):
+        self._content: Optional[str] = None
+        self._key: Optional[str] = None
+
+    def key(self, messages: List[Dict[str, str]]) -> Optional[str]:
+        """Return the key of the leading system message, or None if there is none."""
+        if not messages or messages[0]["role"] != "system":
+            return None
+        content = messages[0]["content"]
+        if content is not self._content:
+            self._content = content
+            self._key = hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+        return self._key
+
 class OpenAIServerModel(Model):
     """
     OpenAI-compatible LLM engine implementation.
@@ -30,6 +56,7 @@ class OpenAIServerModel(Model):
             api_key: Optional[str] = None,
             organization: Optional[str] = None,
             project: Optional[str] = None,
+            prompt_cache: bool = False,
             **kwargs
         ):
         """Initialize OpenAI LLM engine.
@@ -40,6 +67,9 @@ class OpenAIServerModel(Model):
             base_url: Optional API endpoint URL
             organization: Optional organization ID
             project: Optional project ID
+            prompt_cache: Send a `prompt_cache_key` derived from the system prompt in
+                the request body, so steps of the same run are routed to a warm prefix cache.
+                Only enable for endpoints that accept this parameter.
             **kwargs: Additional parameters to pass to the OpenAI API
         """
         try:
@@ -51,6 +81,8 @@ class OpenAIServerModel(Model):
 
         self.kwargs = kwargs
         self.model_id = model_id
+        self.prompt_cache = prompt_cache
+        self._prompt_hasher = _SystemPromptHasher()
         self.client = openai.AsyncOpenAI(
             base_url=base_url,
             api_key=api_key,
@@ -65,6 +97,11 @@ class OpenAIServerModel(Model):
             "messages": messages,
             **self.kwargs,
         }
+        if self.prompt_cache:
+            prompt_cache_key = self._prompt_hasher.key(messages)
+            if prompt_cache_key:
+                # Sent in the request body, since older clients lack the parameter
+                params["extra_body"] = {"prompt_cache_key": prompt_cache_key, **(params.get("extra_body") or {})}
             
         return params
 
@@ -106,6 +143,7 @@ class LiteLLMModel(Model):
             model_id: str,
             base_url: Optional[str] = None,
             api_key: Optional[str] = None,
+            prompt_cache: bool = False,
             **kwargs
         ):
         """Initialize OpenAI LLM engine.
@@ -114,6 +152,8 @@ class LiteLLMModel(Model):
             model_id: Model identifier
             api_key: API authentication key
             base_url: Optional API endpoint URL
+            prompt_cache: Mark the system message with `cache_control` so providers
+                with explicit prompt caching (e.g. Anthropic) reuse it across steps.
             **kwargs: Additional parameters to pass to the API
         """
         try:
@@ -126,9 +166,21 @@ class LiteLLMModel(Model):
         self.model_id = model_id
         self.base_url = base_url
         self.api_key = api_key
+        self.prompt_cache = prompt_cache
 
     def _prepare_params(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         """Prepare parameters for API call"""
+        if self.prompt_cache and messages and messages[0]["role"] == "system":
+            # Copy rather than modify: message dicts are reused by the agent
+            system_message = {
+                "role": "system",
+                "content": [{
+                    "type": "text",
+                    "text": messages[0]["content"],
+                    "cache_control": {"type": "ephemeral"},
+                }],
+            }
+            messages = [system_message, *messages[1:]]
         params = {
             "model": self.model_id,
             "api_base": self.base_url,
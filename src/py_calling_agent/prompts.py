@@ -101,6 +101,11 @@ Please modify your code to:
 3. Print only essential information needed for the task
 """
 
+PARTIAL_EXECUTION_PROMPT = """
+Only the first code block was executed. The code blocks after it were not run, because the code as a whole was rejected:
+{error}
+"""
+
 SECURITY_ERROR_PROMPT = """
 The code execution generated a security error:
 <security_error>
@@ -1,10 +1,109 @@
-from typing import Callable, List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional, Iterator
 from IPython.core.interactiveshell import InteractiveShell
-from IPython.utils.capture import capture_output
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+import ast
+import asyncio
+import copy
 import inspect
+import io
+import itertools
+import sys
+import threading
+import types
 from .security_checker import SecurityChecker, SecurityError
 from traitlets.config import Config
 
+# IPython shells patch process-wide state (builtins, displayhook) while running a
+# cell, so cells offloaded with run_in_thread run one at a time on this thread.
+_execution_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="python-runtime")
+
+class _CapturedOutput:
+    """Output written while one cell runs."""
+
+    def __init__(self):
+        self.owner_thread = threading.get_ident()
+        self.stdout = io.StringIO()
+        self.stderr = io.StringIO()
+
+# The capture of the cell running in the current task or thread
+_current_capture: ContextVar[Optional[_CapturedOutput]] = ContextVar("_current_capture", default=None)
+_active_captures: List[_CapturedOutput] = []
+_captures_lock = threading.Lock()
+_original_streams = None
+
+def _capture_for_current_thread() -> Optional[_CapturedOutput]:
+    """Find the capture that output written from the current context belongs to."""
+    capture = _current_capture.get()
+    if capture is not None:
+        return capture
+    # Threads started by user code do not inherit the context; attribute their
+    # output to the latest cell, unless this thread runs cells itself
+    thread_id = threading.get_ident()
+    with _captures_lock:
+        if _active_captures and all(c.owner_thread != thread_id for c in _active_captures):
+            return _active_captures[-1]
+    return None
+
+class _OutputRouter:
+    """Stand-in for sys.stdout or sys.stderr while cells run, sending each write to the capture of its writer."""
+
+    def __init__(self, original, name: str):
+        self._original = original
+        self._name = name
+
+    def _target(self):
+        capture = _capture_for_current_thread()
+        if capture is None:
+            return self._original
+        return getattr(capture, self._name)
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._original, name)
+
+@contextmanager
+def _capture_output() -> Iterator[_CapturedOutput]:
+    """Capture stdout and stderr of the cell run in the current context.
+
+    The process-wide streams are swapped for routers while any capture is active
+    and restored when the last one ends, so captures may overlap and nest.
+    """
+    global _original_streams
+    capture = _CapturedOutput()
+    with _captures_lock:
+        if not _active_captures:
+            _original_streams = sys.stdout, sys.stderr
+            sys.stdout = _OutputRouter(sys.stdout, "stdout")
+            sys.stderr = _OutputRouter(sys.stderr, "stderr")
+        _active_captures.append(capture)
+    token = _current_capture.set(capture)
+    try:
+        yield capture
+    finally:
+        _current_capture.reset(token)
+        with _captures_lock:
+            _active_captures.remove(capture)
+            if not _active_captures:
+                sys.stdout, sys.stderr = _original_streams
+                _original_streams = None
+
+def _rebind_function(func: types.FunctionType, namespace: Dict[str, Any]) -> types.FunctionType:
+    """Copy a function so it resolves its global names in another namespace."""
+    rebound = types.FunctionType(func.__code__, namespace, func.__name__, func.__defaults__, func.__closure__)
+    rebound.__kwdefaults__ = func.__kwdefaults__
+    rebound.__qualname__ = func.__qualname__
+    rebound.__doc__ = func.__doc__
+    rebound.__annotations__ = func.__annotations__
+    rebound.__dict__.update(func.__dict__)
+    return rebound
+
 class ExecutionResult:
     """
     Represents the result of code execution.
@@ -25,7 +124,7 @@ class PythonExecutor:
     Handles Python code execution using IPython.
     """
 
-    def __init__(self, security_checker: Optional[SecurityChecker] = None):
+    def __init__(self, security_checker: Optional[SecurityChecker] = None, run_in_thread: bool = False):
         """Initialize IPython shell for code execution."""
         
         config = Config()
@@ -42,7 +141,10 @@ class PythonExecutor:
         config.InteractiveShell.autoindent = False
 
         self._shell = InteractiveShell(config=config)
+        # Names IPython defines itself, left out when copying the namespace
+        self._shell_names = frozenset(self._shell.user_ns)
         self._security_checker = security_checker
+        self._run_in_thread = run_in_thread
         
     def inject_into_namespace(self, name: str, value: Any):
         """Inject a value into the execution namespace."""
@@ -59,38 +161,40 @@ class PythonExecutor:
         """   
         try:
             # Perform security check
-            if self._security_checker:
-                violations = self._security_checker.check_code(code)
-                if len(violations) > 0:
-                    violation_details = [str(v) for v in violations]
-                    error_message = (
-                        f"Code execution blocked: {len(violations)} violations found:\n"
-                        + "\n".join(f"  - {detail}" for detail in violation_details)
-                    )
-                    security_error = SecurityError(error_message)
-                    return ExecutionResult(error=security_error, stdout=None)
+            security_error = self._check_security(code)
+            if security_error:
+                return ExecutionResult(error=security_error, stdout=None)
             
-            # Execute the code
-            with capture_output() as output:
+            with _capture_output() as output:
                 transformed_code = self._shell.transform_cell(code)
-                result = await self._shell.run_cell_async(
-                    transformed_code, 
-                    transformed_cell=transformed_code
-                )
+                if self._run_in_thread and not self._shell.should_run_async(
+                    code, transformed_cell=transformed_code, preprocessing_exc_tuple=None
+                ):
+                    # Run synchronous code off the event loop; top-level await has to stay on it
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(
+                        _execution_thread, copy_context().run, self._shell.run_cell, code
+                    )
+                else:
+                    result = await self._shell.run_cell_async(
+                        transformed_code, 
+                        transformed_cell=transformed_code
+                    )
+            stdout = output.stdout.getvalue()
 
             # Handle execution errors
             if result.error_before_exec:
                 return ExecutionResult(
                     error=result.error_before_exec, 
-                    stdout=output.stdout
+                    stdout=stdout
                 )
             if result.error_in_exec:
                 return ExecutionResult(
                     error=result.error_in_exec, 
-                    stdout=output.stdout
+                    stdout=stdout
                 )
             
-            return ExecutionResult(stdout=output.stdout)
+            return ExecutionResult(stdout=stdout)
             
         except SecurityError:
             # Re-raise security errors as-is
@@ -98,9 +202,52 @@ class PythonExecutor:
         except Exception as e:
             return ExecutionResult(error=e)
     
+    def _check_security(self, code: str) -> Optional[SecurityError]:
+        """Run the security checker over the code, returning the error that blocks it."""
+        if not self._security_checker:
+            return None
+        violations = self._security_checker.check_code(code)
+        if len(violations) > 0:
+            violation_details = [str(v) for v in violations]
+            error_message = (
+                f"Code execution blocked: {len(violations)} violations found:\n"
+                + "\n".join(f"  - {detail}" for detail in violation_details)
+            )
+            return SecurityError(error_message)
+        return None
+
+    def check(self, code: str) -> Optional[BaseException]:
+        """Check code without running it.
+
+        Returns:
+            The security or syntax error that would stop the code before it runs, or None
+        """
+        security_error = self._check_security(code)
+        if security_error:
+            return security_error
+        try:
+            compile(self._shell.transform_cell(code), "<cell>", "exec", flags=ast.PyCF_ALLOW_TOP_LEVEL_AWAIT)
+        except (SyntaxError, ValueError) as e:
+            return e
+        return None
+
     def get_from_namespace(self, name: str) -> Any:
         """Get a value from the execution namespace."""
         return self._shell.user_ns.get(name)
+
+    def copy_namespace_to(self, executor: "PythonExecutor"):
+        """Copy the names injected or defined by executed code, without IPython's own, to another executor.
+
+        Functions defined by executed code are rebuilt so their globals are the other
+        executor's namespace; other values are shared by reference.
+        """
+        namespace = self._shell.user_ns
+        for name, value in namespace.items():
+            if name in self._shell_names:
+                continue
+            if isinstance(value, types.FunctionType) and value.__globals__ is namespace:
+                value = _rebind_function(value, executor._shell.user_ns)
+            executor.inject_into_namespace(name, value)
     
     def reset(self):
         """Reset the shell"""
@@ -166,6 +313,10 @@ class Function:
 
         return "\n".join(parts)
     
+# Shared across runtimes so a version number identifies one runtime state
+# even when an agent's runtime is swapped for another.
+_runtime_versions = itertools.count(1)
+
 class PythonRuntime:
     """
     A Python runtime that executes code snippets in an IPython environment.
@@ -173,9 +324,10 @@ class PythonRuntime:
     """
     def __init__(
         self,
-        functions: List[Function] = [],
-        variables: List[Variable] = [],
+        functions: Optional[List[Function]] = None,
+        variables: Optional[List[Variable]] = None,
         security_checker: Optional[SecurityChecker] = None,
+        run_in_thread: bool = False,
     ):
         """
         Initialize runtime with executor and optional initial resources.
@@ -184,16 +336,22 @@ class PythonRuntime:
             functions: List of functions to inject into runtime
             variables: List of variables to inject into runtime
             security_checker: Security checker instance to use for code execution
+            run_in_thread: Run synchronous code on a worker thread so it does not block
+                the event loop. Objects bound to the thread that created them, such as
+                sqlite3 connections, cannot be used by such code.
         """
             
-        self._executor = PythonExecutor(security_checker=security_checker)
+        self._security_checker = security_checker
+        self._run_in_thread = run_in_thread
+        self._executor = PythonExecutor(security_checker=security_checker, run_in_thread=run_in_thread)
         self._functions: Dict[str, Function] = {}
         self._variables: Dict[str, Variable] = {}
+        self._runtime_version = next(_runtime_versions)
 
-        for function in functions:
+        for function in functions or []:
             self.inject_function(function)
         
-        for variable in variables:
+        for variable in variables or []:
             self.inject_variable(variable)
 
     def inject_function(self, function: Function):
@@ -202,6 +360,7 @@ class PythonRuntime:
             raise ValueError(f"Function '{function.name}' already exists")
         self._functions[function.name] = function
         self._executor.inject_into_namespace(function.name, function.func)
+        self._runtime_version = next(_runtime_versions)
     
     def inject_variable(self, variable: Variable):
         """Inject a variable in both metadata and execution namespace."""
@@ -209,16 +368,47 @@ class PythonRuntime:
             raise ValueError(f"Variable '{variable.name}' already exists")
         self._variables[variable.name] = variable
         self._executor.inject_into_namespace(variable.name, variable.value)
+        self._runtime_version = next(_runtime_versions)
 
     async def execute(self, code: str) -> ExecutionResult:
         """Execute code using the executor."""
         return await self._executor.execute(code)
 
+    def check(self, code: str) -> Optional[BaseException]:
+        """Check code with the executor without running it."""
+        return self._executor.check(code)
+
     def get_variable_value(self, name: str) -> Any:
         """Get current value of a variable."""
         if name not in self._variables:
             raise KeyError(f"Variable '{name}' is not managed by this runtime. Available variables: {list(self._variables.keys())}")
         return self._executor.get_from_namespace(name)
+
+    def set_variable_value(self, name: str, value: Any):
+        """Set current value of a variable."""
+        if name not in self._variables:
+            raise KeyError(f"Variable '{name}' is not managed by this runtime. Available variables: {list(self._variables.keys())}")
+        self._executor.inject_into_namespace(name, value)
+
+    def fork(self) -> "PythonRuntime":
+        """Create a runtime with the same functions and the current variable values.
+        
+        Names defined by earlier executions, such as helper functions and imports,
+        are carried over too, and helper functions use the fork's namespace as their
+        globals. The fork has its own execution namespace, so code run in it does not
+        rebind names in this runtime. Values are shared by reference, not copied, and
+        methods of classes defined by earlier executions still use this runtime's
+        namespace.
+        """
+        runtime = PythonRuntime(security_checker=self._security_checker, run_in_thread=self._run_in_thread)
+        self._executor.copy_namespace_to(runtime._executor)
+        for function in self._functions.values():
+            runtime.inject_function(function)
+        for variable in self._variables.values():
+            forked = copy.copy(variable)
+            forked.value = self.get_variable_value(variable.name)
+            runtime.inject_variable(forked)
+        return runtime
     
     def describe_variables(self) -> str:
         """Generate formatted variable descriptions for system prompt."""
@@ -246,4 +436,5 @@ class PythonRuntime:
         """Reset the runtime."""
         self._executor.reset()
         self._functions.clear()
-        self._variables.clear()
\ No newline at end of file
+        self._variables.clear()
+        self._runtime_version = next(_runtime_versions)
\ No newline at end of file
@@ -1,36 +1,81 @@
 import re
-from typing import Union
+import string
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+_formatter = string.Formatter()
+
+class PromptTemplate:
+    """
+    A str.format-style template with some of its fields bound up front.
+
+    The template is parsed once and bound fields are folded into the literal
+    text, so each render only substitutes the remaining fields.
+    """
+
+    def __init__(self, template: str, **bound_fields: Any):
+        self.template = template
+        self._parts: List[Tuple[str, Optional[Tuple[str, Optional[str], str]]]] = []
+
+        literal = ""
+        for text, field_name, format_spec, conversion in _formatter.parse(template):
+            literal += text
+            if field_name is None:
+                continue
+            field = (field_name, conversion, format_spec)
+            if field_name in bound_fields:
+                literal += self._render_field(field, bound_fields)
+            else:
+                self._parts.append((literal, field))
+                literal = ""
+        self._parts.append((literal, None))
+
+    @staticmethod
+    def _render_field(field: Tuple[str, Optional[str], str], values: Dict[str, Any]) -> str:
+        field_name, conversion, format_spec = field
+        value, _ = _formatter.get_field(field_name, (), values)
+        return _formatter.format_field(_formatter.convert_field(value, conversion), format_spec)
+
+    def format(self, **fields: Any) -> str:
+        """Render the template with the remaining (unbound) fields."""
+        chunks = []
+        for literal, field in self._parts:
+            chunks.append(literal)
+            if field is not None:
+                chunks.append(self._render_field(field, fields))
+        return "".join(chunks)
+
+@lru_cache(maxsize=None)
+def _code_block_pattern(python_block_identifier: str) -> re.Pattern:
+    """Compile the code block pattern for a language identifier once."""
+    # A fence line holds only the fence and surrounding whitespace, and the identifier
+    # is case-insensitive. The body is matched line by line up to the closing fence,
+    # or to the end of the text for an unclosed block. Possessive quantifiers keep
+    # malformed output from causing backtracking.
+    return re.compile(
+        rf"^[^\S\n]*+```{re.escape(python_block_identifier)}[^\S\n]*+(?:\n|\Z)"
+        r"((?:.*+\n)*?)"
+        r"(?:[^\S\n]*+```[^\S\n]*+(?:\n|\Z)|(.*+)\Z)",
+        re.MULTILINE | re.IGNORECASE,
+    )
+
+def iter_python_code_blocks(response, python_block_identifier: str) -> Iterator[Tuple[str, bool]]:
+    """Yield (code, closed) for each python code block in LLM output, including empty ones.
+
+    `closed` is False for a trailing block with no closing fence, whose code may
+    still grow if more text is appended to the response.
+    """
+    # Final answers usually contain no fence at all; skip the regex for them
+    if "```" not in response:
+        return
+
+    for match in _code_block_pattern(python_block_identifier).finditer(response):
+        body, unclosed_tail = match.groups()
+        yield (body + (unclosed_tail or "")).rstrip(), unclosed_tail is None
 
 def extract_python_code(response, python_block_identifier: str) -> Union[str, None]:
     """Extract python code block from LLM output"""
-    results = []
-    lines = response.split('\n')
-    i = 0
-    
-    while i < len(lines):
-        line = lines[i]
-        # Check if this line starts a code block
-        if line.strip().lower() == f'```{python_block_identifier.lower()}':
-            # Start collecting code
-            code_lines = []
-            i += 1
-            
-            # Collect lines until we hit closing ``` or end of text
-            while i < len(lines):
-                current_line = lines[i]
-                # Check if this is a closing ```
-                if current_line.strip() == '```':
-                    # This is the end of the code block
-                    break
-                code_lines.append(current_line)
-                i += 1
-            
-            # Add the collected code (even if no closing ``` was found)
-            if code_lines:
-                code = '\n'.join(code_lines).rstrip()
-                if code:
-                    results.append(code)
-        i += 1
+    results = [code for code, _ in iter_python_code_blocks(response, python_block_identifier) if code]
     
     # Return joined results or None
     if results:
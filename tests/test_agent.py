@@ -0,0 +1,351 @@
+import asyncio
+import datetime
+import pytest
+from py_calling_agent import PyCallingAgent, LogLevel, EventType
+from py_calling_agent.agent import SystemMessage, UserMessage, AssistantMessage, ExecutionResultMessage
+from py_calling_agent.models import Model
+from py_calling_agent.python_runtime import PythonRuntime, Variable, Function
+from py_calling_agent.security_checker import SecurityChecker, ImportRule
+
+
+class StubModel(Model):
+    """Model replaying scripted responses, so agent mechanics can be tested offline."""
+
+    def __init__(self, responses=None):
+        self.responses = list(responses or [])
+        self.calls = []
+
+    async def call(self, messages):
+        self.calls.append(messages)
+        return self.responses.pop(0)
+
+    async def stream(self, messages):
+        self.calls.append(messages)
+        response = self.responses.pop(0)
+        for i in range(0, len(response), 3):
+            yield response[i:i + 3]
+
+
+def make_agent(**kwargs):
+    kwargs.setdefault("log_level", LogLevel.ERROR)
+    return PyCallingAgent(StubModel(kwargs.pop("responses", None)), **kwargs)
+
+
+async def collect_events(agent, query):
+    return [event async for event in agent.stream_events(query)]
+
+
+def test_history_keeps_system_message_and_evicts_oldest():
+    """Test trimming keeps the system message and the most recent messages"""
+    agent = make_agent(max_history=4)
+    agent._update_system_message()
+    for i in range(6):
+        agent.add_message(UserMessage(f"message {i}"))
+
+    messages = agent.messages
+    assert len(messages) == 4
+    assert isinstance(messages[0], SystemMessage)
+    assert [m.content for m in messages[1:]] == ["message 3", "message 4", "message 5"]
+
+
+def test_initial_messages_longer_than_max_history():
+    """Test initial history is trimmed to max_history when loaded"""
+    initial = [SystemMessage("system")] + [UserMessage(str(i)) for i in range(10)]
+    agent = make_agent(messages=initial, max_history=3)
+
+    assert [m.content for m in agent.messages] == ["system", "8", "9"]
+    assert [m["content"] for m in agent._prepare_messages()] == ["system", "8", "9"]
+
+
+def test_full_history_fast_path_matches_general_path():
+    """Test the generated preparer for a full history gives the same payload, also after max_history changes"""
+    agent = make_agent(messages=[SystemMessage("system")], max_history=4)
+    for max_history in (4, 6):
+        agent.max_history = max_history
+        for i in range(max_history):
+            agent.add_message(UserMessage(str(i)))
+
+        expected = [m._dict for m in agent.messages]
+        assert agent._prepare_full_history is not None
+        assert agent._prepare_full_history(agent._system_message, agent._history) == expected
+        assert agent._prepare_messages() == expected
+        assert len(expected) == max_history
+
+
+def test_system_prompt_cache_follows_runtime(monkeypatch):
+    """Test the prompt is rebuilt only when the runtime changes, with a fresh time on every call"""
+    times = iter(datetime.datetime(2025, 1, 1, 12, 0, second) for second in range(10))
+    monkeypatch.setattr("py_calling_agent.agent.datetime", type("FakeDatetime", (), {"now": staticmethod(lambda: next(times))}))
+
+    agent = make_agent()
+    original = agent.runtime
+    swapped = PythonRuntime(variables=[Variable("swapped", 1, "Swapped in")])
+    builds = []
+    for runtime in (original, swapped):
+        describe = runtime.describe_functions
+        monkeypatch.setattr(runtime, "describe_functions", lambda describe=describe: builds.append(1) or describe())
+
+    first = agent.build_system_prompt()
+    second = agent.build_system_prompt()
+    assert len(builds) == 1
+    assert "2025-01-01 12:00:00" in first and "2025-01-01 12:00:01" in second
+    assert first.replace("12:00:00", "") == second.replace("12:00:01", "")
+
+    def greet():
+        """Say hello"""
+    original.inject_function(Function(greet))
+    assert "greet()" in agent.build_system_prompt()
+    assert len(builds) == 2
+
+    agent.runtime = swapped
+    prompt = agent.build_system_prompt()
+    assert "swapped" in prompt and "greet()" not in prompt
+    agent.runtime = original
+    assert "greet()" in agent.build_system_prompt()
+    assert len(builds) == 4
+
+
+def test_max_history_change_applies_to_existing_history():
+    """Test lowering max_history trims right away and raising it lets the history grow"""
+    agent = make_agent(messages=[SystemMessage("system")] + [UserMessage(str(i)) for i in range(5)], max_history=6)
+    agent.max_history = 3
+    assert [m.content for m in agent.messages] == ["system", "3", "4"]
+
+    agent.max_history = 5
+    for i in range(5, 8):
+        agent.add_message(UserMessage(str(i)))
+    assert [m.content for m in agent.messages] == ["system", "4", "5", "6", "7"]
+
+
+@pytest.mark.asyncio
+async def test_max_history_of_one_still_sends_the_query():
+    """Test the latest message is kept even when max_history leaves no room for it"""
+    agent = make_agent(max_history=1, responses=["Final answer"])
+    await agent.run("question")
+
+    assert [m["role"] for m in agent.model.calls[0]] == ["system", "user"]
+    assert agent.model.calls[0][1]["content"] == "question"
+
+
+def test_system_prompt_fields_apply_when_assigned():
+    """Test assigning a prompt field after init changes the next system prompt"""
+    agent = make_agent(agent_identity="You are Alpha.")
+    assert "You are Alpha." in agent.build_system_prompt()
+
+    agent.agent_identity = "You are Beta."
+    agent.instructions = "Answer briefly."
+    prompt = agent.build_system_prompt()
+    assert "You are Beta." in prompt and "You are Alpha." not in prompt
+    assert "Answer briefly." in prompt
+    assert agent.agent_identity == "You are Beta."
+
+    agent.system_prompt_template = "{agent_identity} at {current_time}: {functions}"
+    assert agent.build_system_prompt().startswith("You are Beta. at ")
+
+
+def test_messages_is_read_only_and_reassignable():
+    """Test in-place mutation fails loudly and reassignment replaces the history"""
+    agent = make_agent(messages=[UserMessage("hello"), AssistantMessage("hi")])
+
+    with pytest.raises(AttributeError):
+        agent.messages.append(UserMessage("lost"))
+
+    agent.messages = []
+    assert agent.messages == ()
+
+
+@pytest.mark.asyncio
+async def test_stream_fence_inside_string_literal():
+    """Test a fence inside a string does not end the block that gets executed"""
+    agent = make_agent(responses=["```python\ns = '```'\nprint(len(s))\n```", "Done"])
+    events = await collect_events(agent, "count")
+
+    outputs = [e.content for e in events if e.type == EventType.EXECUTION_OUTPUT]
+    assert outputs == ["3\n"]
+    assert events[-1].type == EventType.FINAL_RESPONSE
+
+
+@pytest.mark.asyncio
+async def test_stream_inline_fence_is_final_response():
+    """Test an inline fence in prose is neither executed nor treated as code"""
+    response = "Use ```python x``` style. Final answer 42."
+    agent = make_agent(responses=[response])
+    events = await collect_events(agent, "answer")
+
+    assert not [e for e in events if e.type in (EventType.EXECUTION_OUTPUT, EventType.EXECUTION_ERROR)]
+    assert events[-1].type == EventType.FINAL_RESPONSE
+    assert events[-1].content == response
+
+
+def make_logging_agent(model, log, **runtime_kwargs):
+    runtime = PythonRuntime(variables=[Variable("log", log, "List of executed steps")], **runtime_kwargs)
+    return PyCallingAgent(model, runtime=runtime, log_level=LogLevel.ERROR)
+
+
+class WaitingStubModel(StubModel):
+    """Model that only finishes streaming once the code it sent has run."""
+
+    def __init__(self, responses, log):
+        super().__init__(responses)
+        self.log = log
+
+    async def stream(self, messages):
+        async for chunk in super().stream(messages):
+            yield chunk
+        if self.responses:
+            # Still streaming the first response; the other response is the final answer
+            while not self.log:
+                await asyncio.sleep(0.01)
+            self.log.append("stream end")
+
+
+@pytest.mark.asyncio
+async def test_stream_executes_code_while_streaming():
+    """Test the first block runs before the response finishes streaming, and only once"""
+    log = []
+    agent = make_logging_agent(WaitingStubModel(["```python\nlog.append('cell')\n```\n", "Done"], log), log)
+
+    events = await asyncio.wait_for(collect_events(agent, "go"), timeout=5)
+
+    assert log == ["cell", "stream end"]
+    assert events[-1].type == EventType.FINAL_RESPONSE
+
+
+@pytest.mark.asyncio
+async def test_stream_runs_later_blocks_after_speculated_one():
+    """Test further blocks run after the speculated block as if in one cell"""
+    response = (
+        "First:\n```python\nlog.append('first')\nx = 1\nprint(x)\n```\n"
+        "Then:\n```python\nlog.append('second')\nprint(x + 1)\n```\n"
+    )
+    log = []
+    agent = make_logging_agent(StubModel([response, "Done"]), log)
+    events = await collect_events(agent, "go")
+
+    assert log == ["first", "second"]
+    assert [e.content for e in events if e.type == EventType.EXECUTION_OUTPUT] == ["1\n2\n"]
+
+
+@pytest.mark.parametrize("later_block, security_checker", [
+    ("import os", SecurityChecker([ImportRule({"os"})])),
+    ("log.append('second')\ndef (:", None),
+])
+@pytest.mark.asyncio
+async def test_stream_rejected_later_block_reports_partial_run(later_block, security_checker):
+    """Test later blocks failing the security check or compile are not run, and the feedback says only the first ran"""
+    response = (
+        "```python\nlog.append('first ran')\nprint('first')\n```\n"
+        f"Then:\n```python\n{later_block}\n```\n"
+    )
+    log = []
+    agent = make_logging_agent(StubModel([response, "Done"]), log, security_checker=security_checker)
+    events = await collect_events(agent, "go")
+
+    assert log == ["first ran"]
+    assert agent.runtime._executor.get_from_namespace("os") is None
+    assert not [e for e in events if e.type == EventType.SECURITY_ERROR]
+    errors = [e.content for e in events if e.type == EventType.EXECUTION_ERROR]
+    assert len(errors) == 1
+    assert errors[0].startswith("first\n")
+    assert "code blocks after it were not run" in errors[0]
+
+    feedback = [m.content for m in agent.messages if isinstance(m, ExecutionResultMessage)]
+    assert len(feedback) == 1
+    assert "first\n" in feedback[0]
+    assert "execution was blocked" not in feedback[0]
+
+
+@pytest.mark.asyncio
+async def test_stream_closed_early_waits_for_speculated_block():
+    """Test a block started during streaming finishes when the consumer stops early"""
+    log = []
+    agent = make_logging_agent(StubModel(["```python\nlog.append('cell')\n```\nSome trailing text\n"]), log)
+    stream = agent.stream_events("go")
+
+    async for event in stream:
+        if event.type == EventType.TEXT and "S" in event.content:
+            break
+    await stream.aclose()
+
+    assert log == ["cell"]
+    assert [m.role for m in agent.messages[1:]] == ["user"]
+
+
+class QueryStubModel(Model):
+    """Model replaying scripted responses per user query, so concurrent queries get their own script."""
+
+    def __init__(self, scripts, delays=None):
+        self.scripts = {query: list(responses) for query, responses in scripts.items()}
+        self.delays = delays or {}
+        self.finished = []
+
+    async def call(self, messages):
+        query = next(m["content"] for m in reversed(messages) if m["content"] in self.scripts)
+        await asyncio.sleep(self.delays.get(query, 0))
+        responses = self.scripts[query]
+        if len(responses) == 1:
+            self.finished.append(query)
+        return responses.pop(0)
+
+    async def stream(self, messages):
+        yield await self.call(messages)
+
+
+def make_query_agent(scripts, delays=None):
+    runtime = PythonRuntime(variables=[
+        Variable("a", None, "First result"),
+        Variable("b", None, "Second result"),
+    ])
+    return PyCallingAgent(QueryStubModel(scripts, delays), runtime=runtime, log_level=LogLevel.ERROR)
+
+
+@pytest.mark.asyncio
+async def test_run_many_keeps_query_order():
+    """Test responses come back in query order even when queries finish out of order"""
+    agent = make_query_agent({"slow": ["slow done"], "fast": ["fast done"]}, delays={"slow": 0.05})
+    responses = await agent.run_many(["slow", "fast"])
+
+    assert [r.content for r in responses] == ["slow done", "fast done"]
+    assert agent.model.finished == ["fast", "slow"]
+
+
+@pytest.mark.asyncio
+async def test_run_many_merges_variables_back():
+    """Test variables set by each query land in the runtime, helpers are shared and history is kept"""
+    agent = make_query_agent({
+        "first": ["```python\na = double(1)\n```", "done"],
+        "second": ["```python\nb = double(2)\n```", "done"],
+    })
+    await agent.runtime.execute("def double(x):\n    return x * 2")
+    history = agent.messages
+
+    await agent.run_many(["first", "second"])
+
+    assert agent.runtime.get_variable_value("a") == 2
+    assert agent.runtime.get_variable_value("b") == 4
+    assert agent.messages == history
+
+
+@pytest.mark.asyncio
+async def test_run_many_dependent_queries_share_conversation():
+    """Test dependent queries run in turn on the same runtime and conversation"""
+    agent = make_query_agent({
+        "first": ["```python\na = 1\n```", "a set"],
+        "second": ["```python\nb = a + 1\n```", "b set"],
+    })
+    responses = await agent.run_many(["first", "second"], independent=False)
+
+    assert [r.content for r in responses] == ["a set", "b set"]
+    assert agent.runtime.get_variable_value("b") == 2
+    queries = [m.content for m in agent.messages if m.content in ("first", "second")]
+    assert queries == ["first", "second"]
+
+
+def test_debug_logs_go_to_stdout_and_plain_logs_to_stderr(capsys):
+    """Test DEBUG output keeps using stdout while INFO and ERROR text goes to stderr"""
+    make_agent(log_level=LogLevel.DEBUG).logger.debug("Title", "debug content")
+    make_agent(log_level=LogLevel.INFO).logger.info("Title", "info content")
+
+    captured = capsys.readouterr()
+    assert "debug content" in captured.out and "debug content" not in captured.err
+    assert "info content" in captured.err and "info content" not in captured.out
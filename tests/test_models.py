@@ -0,0 +1,64 @@
+import sys
+import types
+import pytest
+from py_calling_agent.models import OpenAIServerModel, LiteLLMModel
+
+
+@pytest.fixture
+def fake_providers(monkeypatch):
+    """Stand in for the optional provider packages, which are only needed to send requests."""
+    monkeypatch.setitem(sys.modules, "openai", types.SimpleNamespace(AsyncOpenAI=lambda **kwargs: None))
+    monkeypatch.setitem(sys.modules, "litellm", types.SimpleNamespace())
+
+
+def make_messages(system="You are helpful"):
+    return [{"role": "system", "content": system}, {"role": "user", "content": "hi"}]
+
+
+def test_openai_params_without_prompt_cache(fake_providers):
+    """Test no cache key is sent unless prompt caching is enabled"""
+    messages = make_messages()
+    params = OpenAIServerModel("gpt", temperature=0)._prepare_params(messages)
+    assert params == {"model": "gpt", "messages": messages, "temperature": 0}
+
+
+def test_openai_prompt_cache_key_in_extra_body(fake_providers):
+    """Test the cache key goes in extra_body, is stable per system prompt and keeps user extra_body"""
+    model = OpenAIServerModel("gpt", prompt_cache=True, extra_body={"top_k": 5})
+
+    params = model._prepare_params(make_messages())
+    assert "prompt_cache_key" not in params
+    assert params["extra_body"]["top_k"] == 5
+    key = params["extra_body"]["prompt_cache_key"]
+
+    assert model._prepare_params(make_messages())["extra_body"]["prompt_cache_key"] == key
+    assert model._prepare_params(make_messages("Other prompt"))["extra_body"]["prompt_cache_key"] != key
+    assert model.kwargs["extra_body"] == {"top_k": 5}
+
+
+def test_openai_prompt_cache_with_extra_body_none(fake_providers):
+    """Test an explicit extra_body=None is treated as no extra body"""
+    params = OpenAIServerModel("gpt", prompt_cache=True, extra_body=None)._prepare_params(make_messages())
+    assert list(params["extra_body"]) == ["prompt_cache_key"]
+
+
+def test_litellm_prompt_cache_copies_system_message(fake_providers):
+    """Test the system message is marked for caching without modifying the caller's dicts"""
+    messages = make_messages()
+    system_message = messages[0]
+    params = LiteLLMModel("claude", prompt_cache=True)._prepare_params(messages)
+
+    assert params["messages"][0]["content"] == [
+        {"type": "text", "text": "You are helpful", "cache_control": {"type": "ephemeral"}}
+    ]
+    assert params["messages"][1] is messages[1]
+    assert messages[0] is system_message
+    assert system_message == {"role": "system", "content": "You are helpful"}
+
+
+def test_litellm_params_without_prompt_cache(fake_providers):
+    """Test messages are passed through unchanged unless prompt caching is enabled"""
+    messages = make_messages()
+    params = LiteLLMModel("claude", api_key="key")._prepare_params(messages)
+    assert params["messages"] is messages
+    assert params["api_key"] == "key"
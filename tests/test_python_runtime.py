@@ -1,5 +1,9 @@
+import asyncio
+import sqlite3
+import sys
 import pytest
 from py_calling_agent.python_runtime import PythonRuntime, Variable, Function
+from py_calling_agent.security_checker import SecurityChecker, SecurityError, ImportRule
 
 
 @pytest.fixture
@@ -86,3 +90,114 @@ def test_describe_variables(runtime_with_data):
     description = runtime_with_data.describe_variables()
     assert "numbers" in description
     assert "result" in description
+
+
+def test_runtime_version_changes_on_mutation(simple_runtime):
+    """Test injecting resources invalidates the runtime version"""
+    version = simple_runtime._runtime_version
+    simple_runtime.inject_variable(Variable(name="data", value=[1, 2]))
+    assert simple_runtime._runtime_version != version
+
+    version = simple_runtime._runtime_version
+    simple_runtime.describe_variables()
+    assert simple_runtime._runtime_version == version
+
+
+@pytest.mark.asyncio
+async def test_fork_has_separate_namespace(runtime_with_data):
+    """Test a forked runtime starts from current values without sharing state"""
+    await runtime_with_data.execute("result = len(numbers)")
+    forked = runtime_with_data.fork()
+    assert forked.get_variable_value('result') == 9
+
+    await forked.execute("result = sum(numbers)")
+    assert forked.get_variable_value('result') == 36
+    assert runtime_with_data.get_variable_value('result') == 9
+
+    runtime_with_data.set_variable_value('result', 36)
+    assert runtime_with_data.get_variable_value('result') == 36
+
+
+@pytest.mark.asyncio
+async def test_fork_keeps_definitions_from_earlier_executions(simple_runtime):
+    """Test helpers and imports defined before forking are available in the fork"""
+    await simple_runtime.execute("import math\ndef helper(x):\n    return math.sqrt(x)")
+    forked = simple_runtime.fork()
+
+    result = await forked.execute("print(helper(16))")
+    assert result.success
+    assert result.stdout == "4.0\n"
+
+
+def test_check_does_not_run_code(simple_runtime):
+    """Test check reports syntax and security errors without executing anything"""
+    assert simple_runtime.check("x = 1\nawait asyncio.sleep(0)") is None
+    assert isinstance(simple_runtime.check("def (:"), SyntaxError)
+    assert simple_runtime._executor.get_from_namespace("x") is None
+
+    checked = PythonRuntime(security_checker=SecurityChecker([ImportRule({"os"})]))
+    assert isinstance(checked.check("import os"), SecurityError)
+
+
+@pytest.mark.asyncio
+async def test_fork_helpers_use_fork_namespace(runtime_with_data):
+    """Test helpers defined before forking read and write the fork's globals, not the parent's"""
+    await runtime_with_data.execute(
+        "total = 0\n"
+        "def add(x):\n    global total\n    total += x\n"
+        "def summarize():\n    return sum(numbers)"
+    )
+    forked = runtime_with_data.fork()
+
+    result = await forked.execute("add(5)\nnumbers = [10, 20]\nprint(total, summarize())")
+    assert result.stdout == "5 30\n"
+    assert runtime_with_data._executor.get_from_namespace("total") == 0
+    assert runtime_with_data.get_variable_value("numbers") == [3, 1, 4, 1, 5, 9, 2, 6, 5]
+
+    result = await runtime_with_data.execute("print(summarize())")
+    assert result.stdout == "36\n"
+
+
+@pytest.mark.asyncio
+async def test_thread_bound_variable():
+    """Test objects bound to the creating thread, like sqlite3 connections, keep working"""
+    connection = sqlite3.connect(":memory:")
+    runtime = PythonRuntime(variables=[Variable("db", connection, "SQLite connection")])
+
+    result = await runtime.execute("print(db.execute('select 40 + 2').fetchone()[0])")
+    assert result.success
+    assert result.stdout == "42\n"
+
+
+@pytest.mark.parametrize("run_in_thread", [False, True])
+@pytest.mark.asyncio
+async def test_output_of_threads_started_by_code(run_in_thread):
+    """Test output printed by threads the code starts is captured"""
+    runtime = PythonRuntime(run_in_thread=run_in_thread)
+    code = """
+import threading
+worker = threading.Thread(target=print, args=("from thread",))
+worker.start()
+worker.join()
+"""
+    result = await runtime.execute(code)
+    assert result.success
+    assert result.stdout == "from thread\n"
+
+
+@pytest.mark.parametrize("run_in_thread", [False, True])
+@pytest.mark.asyncio
+async def test_concurrent_sync_and_async_cells(run_in_thread):
+    """Test overlapping executions each capture their own output and restore sys.stdout"""
+    original_stdout = sys.stdout
+    async_code = "import asyncio\nprint('before')\nawait asyncio.sleep(0.05)\nprint('after')"
+    sync_code = "import time\ntime.sleep(0.01)\nprint('sync')"
+
+    async_result, sync_result = await asyncio.gather(
+        PythonRuntime(run_in_thread=run_in_thread).execute(async_code),
+        PythonRuntime(run_in_thread=run_in_thread).execute(sync_code),
+    )
+
+    assert async_result.stdout == "before\nafter\n"
+    assert sync_result.stdout == "sync\n"
+    assert sys.stdout is original_stdout
@@ -0,0 +1,39 @@
+import pytest
+from py_calling_agent.utils import PromptTemplate, extract_python_code
+
+
+def test_prompt_template_matches_str_format():
+    """Rendering with bound fields gives the same result as str.format"""
+    template = "{identity}\ntime: {now}\n{{literal}}\n{items}\n{identity!r:>12}"
+    prompt = PromptTemplate(template, identity="agent")
+    expected = template.format(identity="agent", now="12:00", items="a, b")
+    assert prompt.format(now="12:00", items="a, b") == expected
+
+
+def test_prompt_template_bound_values_are_not_reparsed():
+    """Braces inside bound values are kept verbatim"""
+    prompt = PromptTemplate("{context}\n{tail}", context="print(f'{result}')")
+    assert prompt.format(tail="end") == "print(f'{result}')\nend"
+
+
+def test_prompt_template_missing_field():
+    """Unbound fields must be supplied at render time"""
+    prompt = PromptTemplate("{a} {b}", a="x")
+    with pytest.raises(KeyError):
+        prompt.format()
+
+
+def test_extract_python_code():
+    """Code blocks are extracted and joined, plain answers yield None"""
+    response = "First:\n```python\nx = 1\n```\nThen:\n```python\nprint(x)\n```"
+    assert extract_python_code(response, "python") == "x = 1\n\nprint(x)"
+    assert extract_python_code("The answer is 42", "python") is None
+    assert extract_python_code("Use `x` here", "python") is None
+
+
+def test_extract_python_code_fence_variants():
+    """Fence lines may be indented or differently cased, blocks may be unclosed"""
+    assert extract_python_code("  ```Python  \r\nx = 1\r\n  ```\r\n", "python") == "x = 1"
+    assert extract_python_code("```python\nx = 1\ny = 2", "python") == "x = 1\ny = 2"
+    assert extract_python_code("code: ```python\nx = 1\n```", "python") is None
+    assert extract_python_code("```python\n\n```", "python") is None